@@ -0,0 +1,172 @@
+"""Shared camera helpers: device discovery and the preview/capture loop.
+
+main.py and utils/test_camera.py drive a webcam the same way; the V4L2
+configuration, threaded grabber and display loop live here so an
+optimization lands once and applies to both.
+"""
+import cv2
+import os
+import glob
+import time
+import logging
+import threading
+
+logger = logging.getLogger("VisionAI.camera")
+
+# pollKey (OpenCV >= 4.5.3) pumps GUI events and returns immediately,
+# unlike waitKey(1) which always sleeps ~1ms. Fall back on older builds.
+_poll_key = getattr(cv2, 'pollKey', lambda: cv2.waitKey(1))
+
+# Hoisted out of the display loop so each iteration is two int compares.
+_KEY_SPACE = ord(' ')
+_KEY_Q = ord('q')
+_KEY_NONE = 0xFF
+
+
+def open_first_camera():
+    """Find and open the first working capture device.
+
+    Enumerates /dev/video* via sysfs instead of blindly probing indices
+    0-3: each failed VideoCapture() open can burn 200-500ms in driver
+    ioctls, while reading sysfs is instant. Surviving candidates are
+    opened in parallel and the first that works wins.
+    """
+    candidates = []
+    for dev in sorted(glob.glob('/dev/video*')):
+        # Skip metadata/IR sibling nodes that never deliver frames.
+        name_path = f"/sys/class/video4linux/{os.path.basename(dev)}/name"
+        try:
+            with open(name_path) as f:
+                name = f.read().strip()
+        except OSError:
+            name = dev
+        if 'metadata' in name.lower() or 'infrared' in name.lower():
+            continue
+        candidates.append((dev, name))
+
+    result = [None]
+    result_lock = threading.Lock()
+
+    def _try_open(dev, name):
+        cap = cv2.VideoCapture(dev)
+        if cap.isOpened():
+            with result_lock:
+                if result[0] is None:
+                    logger.info(f"Connected to camera device {dev} ({name})")
+                    result[0] = cap
+                    return
+        cap.release()
+
+    threads = [threading.Thread(target=_try_open, args=c) for c in candidates]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return result[0]
+
+
+def configure_capture(cap, width=640, height=480):
+    """Ask V4L2 for compressed frames at a modest resolution.
+
+    MJPEG at 640x480 means far fewer bytes per cap.read() and no
+    full-resolution YUY2->BGR conversion. These are requests, not
+    guarantees - the driver falls back to whatever it supports.
+    """
+    cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
+    cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+
+
+def run_preview_loop(cap, on_capture, window="Vision AI Feed"):
+    """Show a live preview and call on_capture(frame) on each SPACE press.
+
+    A grabber thread publishes the newest frame into a single slot and a
+    display thread renders it and handles keys, so on_capture dispatch
+    never stalls the preview. on_capture must return quickly - hand
+    slow work (inference, disk writes) to another thread or queue.
+    Blocks until the user presses Q; the caller releases cap.
+    """
+    latest_frame = None
+    frame_lock = threading.Lock()
+    stop = threading.Event()
+
+    def _grabber():
+        nonlocal latest_frame
+        dropped = 0
+        last_report = time.time()
+        try:
+            while not stop.is_set():
+                ret, f = cap.read()
+                if not ret:
+                    # Aggregate drops and report once a second instead of
+                    # formatting a log record inside the tight read loop.
+                    dropped += 1
+                    now = time.time()
+                    if now - last_report >= 1.0:
+                        logger.warning(f"Dropped {dropped} frame(s) from camera.")
+                        dropped = 0
+                        last_report = now
+                    time.sleep(0.05)
+                    continue
+                with frame_lock:
+                    latest_frame = f
+        except Exception as e:
+            logger.error(f"Camera grabber failed: {e}")
+        finally:
+            # A dead grabber would leave the preview frozen on a stale
+            # frame; shut the whole loop down instead.
+            stop.set()
+
+    # Display and key handling get their own thread so the grabber (and
+    # whatever on_capture feeds) never pay HighGUI cost (X11 roundtrips,
+    # BGR->XImage conversion of every preview frame). startWindowThread()
+    # lets GTK-backed HighGUI pump events off the main thread.
+    def _display():
+        try:
+            cv2.namedWindow(window)
+            while not stop.is_set():
+                with frame_lock:
+                    frame = latest_frame
+
+                if frame is None:
+                    # Camera still warming up.
+                    time.sleep(0.01)
+                    continue
+
+                cv2.imshow(window, frame)
+                key = _poll_key() & 0xFF
+
+                if key == _KEY_NONE:
+                    # No key pending - yield briefly instead of spinning at 100%.
+                    time.sleep(0.001)
+
+                elif key == _KEY_Q:
+                    logger.info("Exiting preview loop...")
+                    stop.set()
+
+                elif key == _KEY_SPACE:
+                    on_capture(frame)
+
+            cv2.destroyAllWindows()
+        except Exception as e:
+            logger.error(f"Display loop failed: {e}")
+        finally:
+            # Ensure the caller's stop.wait() returns even if we died
+            # before [Q] - e.g. a headless OpenCV build without HighGUI,
+            # or an on_capture callback blowing up. A visible crash is
+            # recoverable; a silent hang is not.
+            stop.set()
+
+    cv2.startWindowThread()
+    grabber_thread = threading.Thread(target=_grabber, daemon=True)
+    grabber_thread.start()
+    display_thread = threading.Thread(target=_display, daemon=True)
+    display_thread.start()
+
+    # The calling thread just waits for [Q]; all the work happens on the
+    # grabber and display threads (plus whatever on_capture dispatches).
+    stop.wait()
+    display_thread.join(timeout=2)
+    # Wait for the grabber too: callers release cap right after we
+    # return, and a cap.read() still in flight would race the release.
+    grabber_thread.join(timeout=2)